@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     CORS_ORIGINS: list[str] = ["http://localhost:5173", "http://localhost:3000"]
     model_config = {"env_file": ".env", "extra": "ignore"}
     GANACHE_URL: str
+    BALANCE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    BALANCE_FLUSH_BATCH_SIZE: int = 100
+    MULTICALL_ADDRESS: str | None = None  # Multicall3 deployed on the local chain
+    MULTICALL_BATCH_SIZE: int = 500
 
 settings = Settings()
 
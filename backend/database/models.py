@@ -26,3 +26,12 @@ class Account(Base):
     balance = Column(Float, default=0.0, nullable=False)
     is_active = Column(Boolean, default=False, nullable=False)
 
+class RegisteredToken(Base):
+    __tablename__ = 'tokens'
+
+    id = Column(Integer, primary_key=True, index=True)
+    address = Column(String, unique=True, nullable=False)  # Checksummed ERC-20 contract address
+    symbol = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    decimals = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
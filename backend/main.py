@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -5,6 +6,7 @@ from configuration.config import settings
 from database import models
 from database.db_config import engine, SessionLocal
 from routers import auth, admin, users
+from service.balance_updater import balance_updater
 
 # Ensure database tables are created
 models.Base.metadata.create_all(bind=engine)
@@ -13,8 +15,20 @@ models.Base.metadata.create_all(bind=engine)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("FastAPI application starting...")
+    flush_task = asyncio.create_task(balance_updater.run_periodic_flush())
     yield
     print("FastAPI application shutting down...")
+    flush_task.cancel()
+    try:
+        await flush_task
+    except asyncio.CancelledError:
+        pass
+    # Write any balances still waiting for the next batch; flush() waits for a
+    # periodic flush that cancel() could not stop mid-write
+    try:
+        balance_updater.flush()
+    except Exception as exc:
+        print(f"Balance flush failed during shutdown: {exc}")
     # Ensure DB session cleanup
     SessionLocal().close()
 
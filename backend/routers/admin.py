@@ -4,6 +4,11 @@ from database.models import Users, Account
 from typing import Annotated
 from dependencies.database_dependency import get_db
 from dependencies.user_dependency import get_current_user
+from schemas.register_token_request import RegisterTokenRequest
+from service.balance_updater import balance_updater
+from service.portfolio_service import get_portfolios
+from service.token_service import list_tokens, register_token
+from service.web3_service import GanacheUnavailableError, MulticallNotConfiguredError, get_rpc_coalescing_stats
 
 router = APIRouter(
     prefix='/admin',
@@ -25,6 +30,39 @@ async def read_all_accounts(user: user_dependency, db: db_dependency):
         raise HTTPException(status_code=403, detail="Unauthorized Access")
     return db.query(Account).all()
 
+@router.get("/rpc-stats", status_code=status.HTTP_200_OK)
+async def read_rpc_stats(user: user_dependency):
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Unauthorized Access")
+    return get_rpc_coalescing_stats()
+
+@router.post("/tokens", status_code=status.HTTP_201_CREATED)
+def add_token(user: user_dependency, db: db_dependency, register_token_request: RegisterTokenRequest):
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Unauthorized Access")
+
+    try:
+        token = register_token(db, register_token_request.address)
+    except GanacheUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"message": "Token registered successfully", "token_id": token.id, "symbol": token.symbol}
+
+@router.get("/portfolios", status_code=status.HTTP_200_OK)
+def read_all_portfolios(user: user_dependency, db: db_dependency):
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Unauthorized Access")
+
+    public_keys = [key for (key,) in db.query(Users.public_key).filter(Users.public_key.isnot(None)).all()]
+    try:
+        return get_portfolios(list_tokens(db), public_keys)
+    except (GanacheUnavailableError, MulticallNotConfiguredError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/delete-user/{user_id}", status_code=status.HTTP_200_OK)
 async def delete_user(user: user_dependency, db: db_dependency, user_id: int = Path(gt=0)):
 
@@ -41,6 +79,7 @@ async def delete_user(user: user_dependency, db: db_dependency, user_id: int = P
     if user_account_to_delete is None:
         raise HTTPException(status_code=404, detail="User Account Not Found!")
 
+    balance_updater.discard(user_account_to_delete.account_id)
     db.delete(user_to_delete)  # This deletes account too thanks to CASCADE
     db.commit()
 
@@ -1,4 +1,5 @@
 from fastapi import Depends, HTTPException, status, APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from database.models import Users, Account
 from typing import Annotated
 from sqlalchemy.orm import Session
@@ -6,7 +7,10 @@ from dependencies.database_dependency import get_db
 from dependencies.user_dependency import get_current_user
 from schemas.transfer_request import TransferRequest
 from service.account_service import setup_account_for_user, update_db_after_transfer_eth
-from service.web3_service import GanacheUnavailableError, ensure_account_exists_on_ganache, get_account_balance_from_blockchain, get_transactions_for_address, send_eth
+from service.balance_updater import balance_updater
+from service.portfolio_service import get_portfolios, get_token_transfers
+from service.token_service import list_tokens
+from service.web3_service import GanacheUnavailableError, MulticallNotConfiguredError, ensure_account_exists_on_ganache, get_account_balance_from_blockchain, get_transactions_for_address, send_eth
 from service.websocket_manager import manager
 
 
@@ -15,13 +19,17 @@ router = APIRouter(
     tags=['user']
 )
 
+# Handlers that read the chain are plain `def` (or use run_in_threadpool) so the
+# blocking web3 calls run in FastAPI's threadpool, where concurrent identical
+# reads can share one in-flight RPC.
+
 db_dependency = Annotated [Session,Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
  #### End Points ####
 
 @router.post("/set-up-account", status_code=status.HTTP_201_CREATED)
-async def set_up_account(user: user_dependency, db: db_dependency, public_key: str):
+def set_up_account(user: user_dependency, db: db_dependency, public_key: str):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
 
@@ -56,7 +64,7 @@ async def set_up_account(user: user_dependency, db: db_dependency, public_key: s
     }
 
 @router.get("/user-transactions", status_code=status.HTTP_200_OK)
-async def list_transactions(user: user_dependency, db: db_dependency):
+def list_transactions(user: user_dependency, db: db_dependency):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication Failed")
 
@@ -66,6 +74,7 @@ async def list_transactions(user: user_dependency, db: db_dependency):
 
     try:
         txs = get_transactions_for_address(public_key) or []
+        token_transfers = get_token_transfers(list_tokens(db), public_key)
     except GanacheUnavailableError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
@@ -86,7 +95,7 @@ async def list_transactions(user: user_dependency, db: db_dependency):
         if user.public_key
     }
 
-    for tx in txs:
+    for tx in txs + token_transfers:
         from_addr = (tx.get("from") or "").lower()
         to_addr_raw = tx.get("to") or ""
         to_addr = to_addr_raw.lower() if to_addr_raw else ""
@@ -97,10 +106,34 @@ async def list_transactions(user: user_dependency, db: db_dependency):
             "External/Contract" if to_addr_raw else "External/Contract",
         )
 
-    return {"transactions": txs}
+    return {"transactions": txs, "token_transfers": token_transfers}
+
+@router.get("/tokens", status_code=status.HTTP_200_OK)
+async def read_tokens(user: user_dependency, db: db_dependency):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return list_tokens(db)
+
+@router.get("/portfolio", status_code=status.HTTP_200_OK)
+def get_portfolio(user: user_dependency, db: db_dependency):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+
+    public_key = user.get("public_key")
+    if not public_key:
+        raise HTTPException(status_code=400, detail="User does not have a public key set")
+
+    try:
+        result = get_portfolios(list_tokens(db), [public_key])
+    except (GanacheUnavailableError, MulticallNotConfiguredError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"block_number": result["block_number"], **result["portfolios"][public_key.lower()]}
 
 @router.get("/account", status_code=status.HTTP_200_OK)
-async def get_account(user: user_dependency, db: db_dependency):
+def get_account(user: user_dependency, db: db_dependency):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
 
@@ -119,9 +152,7 @@ async def get_account(user: user_dependency, db: db_dependency):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    db_account.balance = chain_balance
-    db.commit()
-    db.refresh(db_account)
+    balance_updater.queue(db_account, chain_balance)
 
     return {"balance": db_account.balance, "account_id": db_account.account_id}
 
@@ -157,7 +188,7 @@ async def transfer_eth(user: user_dependency, db: db_dependency, transfer_reques
         raise HTTPException(status_code=400, detail="User does not have a public key set")
 
     try:
-        curr_user_balance = get_account_balance_from_blockchain(public_key)
+        curr_user_balance = await run_in_threadpool(get_account_balance_from_blockchain, public_key)
     except GanacheUnavailableError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
@@ -179,7 +210,8 @@ async def transfer_eth(user: user_dependency, db: db_dependency, transfer_reques
 
     # Use web3 service to transfer the money
     try:
-        tx_hash = send_eth(
+        tx_hash = await run_in_threadpool(
+            send_eth,
             from_address=public_key,
             to_address=to_account_user.public_key,
             amount=transfer_request.amount,
@@ -190,10 +222,10 @@ async def transfer_eth(user: user_dependency, db: db_dependency, transfer_reques
         raise HTTPException (status_code=400 , detail=f"{e}")
 
     # Update user who delivers the eth
-    update_db_after_transfer_eth(db, public_key, from_account)
+    await run_in_threadpool(update_db_after_transfer_eth, db, public_key, from_account)
 
     # Update user who gets the eth
-    update_db_after_transfer_eth(db, to_account_user.public_key , to_account)
+    await run_in_threadpool(update_db_after_transfer_eth, db, to_account_user.public_key, to_account)
 
     await manager.send_personal_message("update_balance", to_account_user.id)
 
@@ -209,6 +241,7 @@ async def delete_account(user: user_dependency, db: db_dependency):
     if not existing_account_to_delete:
         raise HTTPException(status_code=400, detail='User Dont Have an Account')
 
+    balance_updater.discard(existing_account_to_delete.account_id)
     db.delete(existing_account_to_delete)
     db.commit()  # Single commit for both operations
 
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+
+
+class RegisterTokenRequest(BaseModel):
+    address: str = Field(min_length=42, max_length=42, description="ERC-20 contract address on the local chain")
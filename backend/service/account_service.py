@@ -1,4 +1,5 @@
 from database.models import Account, Users
+from service.balance_updater import balance_updater
 from service.web3_service import get_account_balance_from_blockchain
 from sqlalchemy.orm import Session
 
@@ -29,6 +30,6 @@ def setup_account_for_user(db: Session, user: Users) -> Account:
     return new_account
 
 def update_db_after_transfer_eth(db: Session, user_public_key: str, user_account: Account)-> None:
-    user_account.balance=get_account_balance_from_blockchain(user_public_key)
-    db.commit()
-    db.refresh(user_account)
+    # Written to the DB by the next batched flush; user_account reflects it now
+    balance_updater.queue(user_account, get_account_balance_from_blockchain(user_public_key, coalesce=False))
+
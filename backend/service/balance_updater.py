@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from configuration.config import settings
+from database.db_config import SessionLocal
+from database.models import Account
+
+_account_table = Account.__table__
+
+# One executemany UPDATE for every pending account
+_bulk_balance_update = (
+    update(_account_table)
+    .where(_account_table.c.account_id == bindparam("b_account_id"))
+    .values(balance=bindparam("b_balance"))
+)
+
+class BalanceWriteBehind:
+    """
+    Collect account balance changes in memory and write them in one bulk
+    UPDATE from the background flush task, either every flush_interval
+    seconds or as soon as batch_size accounts are pending.
+
+    Until a balance is written, every Account loaded or refreshed from the DB
+    (including reloads after a commit expires it) gets the pending value
+    re-applied, so readers never see the older stored balance.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One flush at a time (periodic task vs shutdown)
+        self._pending: dict[int, float] = {}
+        self._flushing: dict[int, float] = {}  # Batch being written, still visible to readers
+        self._discarded: set[int] = set()      # Deleted while in _flushing; never re-queued
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+
+    def queue(self, account: Account, balance: float) -> None:
+        # The caller's ORM object shows the new balance right away without
+        # being marked dirty, so its session never writes the row itself.
+        set_committed_value(account, "balance", balance)
+        with self._lock:
+            self._pending[account.account_id] = balance
+            self._discarded.discard(account.account_id)
+            batch_full = len(self._pending) >= self.batch_size
+            loop, wake = self._loop, self._wake
+        if batch_full and loop is not None and wake is not None:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass  # Loop already closed; the shutdown flush writes the batch
+
+    def pending_balance(self, account_id: int) -> float | None:
+        with self._lock:
+            if account_id in self._pending:
+                return self._pending[account_id]
+            return self._flushing.get(account_id)
+
+    def discard(self, account_id: int) -> None:
+        with self._lock:
+            self._pending.pop(account_id, None)
+            if self._flushing.pop(account_id, None) is not None:
+                self._discarded.add(account_id)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            return self._flush_batch()
+
+    def _flush_batch(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flushing = dict(batch)
+        if not batch:
+            return 0
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                _bulk_balance_update,
+                [{"b_account_id": account_id, "b_balance": balance} for account_id, balance in batch.items()],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the batch back unless a newer balance was queued meanwhile
+            # or the account was deleted
+            with self._lock:
+                for account_id, balance in batch.items():
+                    if account_id not in self._discarded:
+                        self._pending.setdefault(account_id, balance)
+            raise
+        finally:
+            with self._lock:
+                self._flushing = {}
+                self._discarded.difference_update(batch)
+            db.close()
+        return len(batch)
+
+    async def run_periodic_flush(self) -> None:
+        wake = asyncio.Event()
+        with self._lock:
+            self._loop, self._wake = asyncio.get_running_loop(), wake
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as exc:
+                    print(f"Balance flush failed, will retry: {exc}")
+        finally:
+            with self._lock:
+                self._loop, self._wake = None, None
+
+balance_updater = BalanceWriteBehind(
+    batch_size=settings.BALANCE_FLUSH_BATCH_SIZE,
+    flush_interval=settings.BALANCE_FLUSH_INTERVAL_SECONDS,
+)
+
+@event.listens_for(Account, "load")
+def _apply_pending_balance_on_load(account: Account, context) -> None:
+    pending = balance_updater.pending_balance(account.account_id)
+    if pending is not None:
+        set_committed_value(account, "balance", pending)
+
+@event.listens_for(Account, "refresh")
+def _apply_pending_balance_on_refresh(account: Account, context, attrs) -> None:
+    if attrs is None or "balance" in attrs:
+        _apply_pending_balance_on_load(account, context)
@@ -0,0 +1,87 @@
+import threading
+from decimal import Decimal
+
+from database.models import RegisteredToken
+from service.web3_service import get_balances_via_multicall, get_erc20_transfers_for_address, get_latest_block
+
+class BlockBalanceCache:
+    """
+    Raw balances keyed by (owner, token) for a single block. Balances cannot
+    change within a block, so entries stay valid until the chain moves on.
+    The block is identified by hash, so a restarted chain that reaches the
+    same height never serves the old chain's balances.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._block_hash: bytes | None = None
+        self._balances: dict[tuple[str, str | None], int | None] = {}
+
+    def get_many(self, block_hash: bytes, keys: list[tuple[str, str | None]]) -> dict[tuple[str, str | None], int | None]:
+        with self._lock:
+            if block_hash != self._block_hash:
+                return {}
+            return {key: self._balances[key] for key in keys if key in self._balances}
+
+    def put_many(self, block_hash: bytes, balances: dict[tuple[str, str | None], int | None]) -> None:
+        with self._lock:
+            if block_hash != self._block_hash:
+                self._block_hash = block_hash
+                self._balances = {}
+            self._balances.update(balances)
+
+balance_cache = BlockBalanceCache()
+
+def _to_units(raw_balance: int | None, decimals: int) -> float | None:
+    if raw_balance is None:
+        return None
+    return float(Decimal(raw_balance) / (Decimal(10) ** decimals))
+
+def get_portfolios(tokens: list[RegisteredToken], public_keys: list[str]) -> dict:
+    """
+    ETH and registered token balances for a group of addresses, read at the
+    latest block with batched multicalls and cached for that block.
+    """
+    latest_block = get_latest_block()
+    block_number, block_hash = latest_block["number"], bytes(latest_block["hash"])
+    owners = list(dict.fromkeys(key.lower() for key in public_keys))
+    token_addresses = [token.address.lower() for token in tokens]
+
+    keys = [(owner, token) for owner in owners for token in [None, *token_addresses]]
+    balances = balance_cache.get_many(block_hash, keys)
+    missing_owners = list(dict.fromkeys(owner for owner, token in keys if (owner, token) not in balances))
+    if missing_owners:
+        fetched = get_balances_via_multicall(missing_owners, token_addresses, block_number)
+        balance_cache.put_many(block_hash, fetched)
+        balances.update(fetched)
+
+    portfolios = {}
+    for owner in owners:
+        portfolios[owner] = {
+            "address": owner,
+            "eth_balance": _to_units(balances.get((owner, None)), 18),
+            "tokens": [
+                {
+                    "address": token.address,
+                    "symbol": token.symbol,
+                    "name": token.name,
+                    "decimals": token.decimals,
+                    "balance": _to_units(balances.get((owner, token.address.lower())), token.decimals),
+                }
+                for token in tokens
+            ],
+        }
+    return {"block_number": block_number, "portfolios": portfolios}
+
+def get_token_transfers(tokens: list[RegisteredToken], public_key: str) -> list[dict]:
+    """
+    Registered-token Transfer events for an address, scaled by token decimals.
+    """
+    tokens_by_address = {token.address.lower(): token for token in tokens}
+    transfers = get_erc20_transfers_for_address(public_key, [token.address for token in tokens])
+
+    for transfer in transfers:
+        token = tokens_by_address[transfer["token_address"].lower()]
+        transfer["symbol"] = token.symbol
+        transfer["value"] = _to_units(transfer["value"], token.decimals)
+    return transfers
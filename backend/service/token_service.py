@@ -0,0 +1,32 @@
+from database.models import RegisteredToken
+from service.web3_service import get_erc20_metadata
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+def register_token(db: Session, token_address: str) -> RegisteredToken:
+
+    """
+    Add an ERC-20 token to the registry, reading its metadata from the chain.
+    """
+
+    metadata = get_erc20_metadata(token_address)
+
+    existing_token = db.query(RegisteredToken).filter(RegisteredToken.address == metadata["address"]).first()
+    if existing_token:
+        raise ValueError("Token already registered")
+
+    new_token = RegisteredToken(**metadata)
+
+    db.add(new_token)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent registration of the same token won the insert
+        db.rollback()
+        raise ValueError("Token already registered")
+    db.refresh(new_token)
+
+    return new_token
+
+def list_tokens(db: Session) -> list[RegisteredToken]:
+    return db.query(RegisteredToken).order_by(RegisteredToken.symbol).all()
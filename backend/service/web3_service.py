@@ -1,5 +1,10 @@
+import copy
+import threading
+from typing import Any, Callable, Hashable
+
 from requests.exceptions import RequestException
 from web3 import Web3
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
 from configuration.config import settings
 
@@ -14,6 +19,119 @@ GANACHE_UNAVAILABLE_MESSAGE = (
 class GanacheUnavailableError(RuntimeError):
     pass
 
+class MulticallNotConfiguredError(RuntimeError):
+    pass
+
+ERC20_ABI = [
+    {"name": "balanceOf", "type": "function", "stateMutability": "view",
+     "inputs": [{"name": "owner", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+    {"name": "decimals", "type": "function", "stateMutability": "view",
+     "inputs": [], "outputs": [{"name": "", "type": "uint8"}]},
+    {"name": "symbol", "type": "function", "stateMutability": "view",
+     "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"name": "name", "type": "function", "stateMutability": "view",
+     "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"name": "Transfer", "type": "event", "anonymous": False,
+     "inputs": [{"name": "from", "type": "address", "indexed": True},
+                {"name": "to", "type": "address", "indexed": True},
+                {"name": "value", "type": "uint256", "indexed": False}]},
+]
+
+# Subset of Multicall3 (https://github.com/mds1/multicall) used by the portfolio reads
+MULTICALL3_ABI = [
+    {"name": "aggregate3", "type": "function", "stateMutability": "payable",
+     "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+         {"name": "target", "type": "address"},
+         {"name": "allowFailure", "type": "bool"},
+         {"name": "callData", "type": "bytes"}]}],
+     "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+         {"name": "success", "type": "bool"},
+         {"name": "returnData", "type": "bytes"}]}]},
+    {"name": "getEthBalance", "type": "function", "stateMutability": "view",
+     "inputs": [{"name": "addr", "type": "address"}], "outputs": [{"name": "balance", "type": "uint256"}]},
+]
+
+TRANSFER_EVENT_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+class _InFlightCall:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent RPC reads: the first caller for a key runs
+    the call, every caller arriving while it is in flight waits and gets the
+    same result (or a copy of its exception). Nothing is cached once the call
+    returns. Keys are tuples whose first item names the kind of call, and
+    metrics are kept per kind.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _InFlightCall] = {}
+        self._executed: dict[Hashable, int] = {}  # RPC calls actually sent to the node
+        self._shared: dict[Hashable, int] = {}    # callers served by another caller's in-flight RPC
+
+    def do(self, key: tuple, fn: Callable[[], Any]) -> Any:
+        kind = key[0]
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._shared[kind] = self._shared.get(kind, 0) + 1
+                is_leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._executed[kind] = self._executed.get(kind, 0) + 1
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                # Each waiter raises its own exception so tracebacks don't mix across threads
+                raise _copy_error(call.error) from call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            executed, shared, in_flight = dict(self._executed), dict(self._shared), len(self._calls)
+        kinds = {}
+        for kind, kind_executed in executed.items():
+            kind_shared = shared.get(kind, 0)
+            kinds[kind] = {
+                "requested": kind_executed + kind_shared,
+                "executed": kind_executed,
+                "shared": kind_shared,
+                # Average number of callers served per RPC actually sent
+                "fan_in_ratio": round((kind_executed + kind_shared) / kind_executed, 3),
+            }
+        return {"in_flight": in_flight, "kinds": kinds}
+
+def _copy_error(error: BaseException) -> BaseException:
+    try:
+        return copy.copy(error)
+    except Exception:
+        return RuntimeError(f"Coalesced RPC call failed: {error!r}")
+
+rpc_single_flight = SingleFlight()
+
+def get_rpc_coalescing_stats() -> dict:
+    return rpc_single_flight.stats()
+
+# Health checks are not coalesced, so they stay out of the coalescing metrics
 def _ensure_ganache_available() -> None:
     try:
         if not web3_ganache.is_connected():
@@ -35,12 +153,33 @@ def ensure_account_exists_on_ganache(public_key: str) -> None:
         raise ValueError("Public key not found on Ganache")
 
 # Get the balance of an Ethereum account
-def get_account_balance_from_blockchain(user_public_key) -> float:
+# coalesce=False skips single-flight: use it right after a write (e.g. send_eth),
+# since a shared in-flight read may have started before the tx was mined.
+def get_account_balance_from_blockchain(user_public_key, coalesce: bool = True) -> float:
 
     _ensure_ganache_available()
-    balance_wei = web3_ganache.eth.get_balance(user_public_key)
+    if coalesce:
+        balance_wei = rpc_single_flight.do(
+            ("get_balance", str(user_public_key).lower()),
+            lambda: web3_ganache.eth.get_balance(user_public_key),
+        )
+    else:
+        balance_wei = web3_ganache.eth.get_balance(user_public_key)
     return web3_ganache.from_wei(balance_wei, 'ether')
 
+def get_block_number() -> int:
+    return rpc_single_flight.do(("block_number",), lambda: web3_ganache.eth.block_number)
+
+def get_block(block_number: int | str, full_transactions: bool = False):
+    return rpc_single_flight.do(
+        ("get_block", block_number, full_transactions),
+        lambda: web3_ganache.eth.get_block(block_number, full_transactions=full_transactions),
+    )
+
+def get_latest_block():
+    _ensure_ganache_available()
+    return get_block("latest")
+
 def get_transactions_for_address(address: str, start_block: int | None = None, end_block: int | None = None) -> list[dict]:
     """
     Fetch all transactions involving the given address (as sender or recipient)
@@ -50,7 +189,7 @@ def get_transactions_for_address(address: str, start_block: int | None = None, e
         raise ValueError("Invalid Ethereum address")
 
     _ensure_ganache_available()
-    latest_block = web3_ganache.eth.block_number
+    latest_block = get_block_number()
     start = 0 if start_block is None else start_block
     end = latest_block if end_block is None else end_block
 
@@ -58,7 +197,7 @@ def get_transactions_for_address(address: str, start_block: int | None = None, e
     txs: list[dict] = []
 
     for block_number in range(start, end + 1):
-        block = web3_ganache.eth.get_block(block_number, full_transactions=True)
+        block = get_block(block_number, full_transactions=True)
         for tx in block.transactions:
             tx_from = (tx["from"] or "").lower()
             tx_to = (tx["to"] or "").lower() if tx["to"] else ""
@@ -99,3 +238,120 @@ def send_eth(from_address: str, to_address: str, amount: float) -> str:
 
     return tx_hash.hex()
 
+def get_erc20_metadata(token_address: str) -> dict:
+    """
+    Read symbol, name and decimals from an ERC-20 contract.
+    """
+    if not web3_ganache.is_address(token_address):
+        raise ValueError("Invalid token address")
+
+    _ensure_ganache_available()
+    address = Web3.to_checksum_address(token_address)
+    if not web3_ganache.eth.get_code(address):
+        raise ValueError("No contract deployed at token address")
+
+    token = web3_ganache.eth.contract(address=address, abi=ERC20_ABI)
+    try:
+        return {
+            "address": address,
+            "symbol": token.functions.symbol().call(),
+            "name": token.functions.name().call(),
+            "decimals": token.functions.decimals().call(),
+        }
+    except (ContractLogicError, BadFunctionCallOutput) as exc:
+        raise ValueError("Contract does not implement the ERC-20 metadata interface") from exc
+
+def get_balances_via_multicall(owners: list[str], token_addresses: list[str], block_number: int) -> dict[tuple[str, str | None], int | None]:
+    """
+    Read the ETH balance and every token balance of every owner at block_number
+    with one aggregate3 eth_call per MULTICALL_BATCH_SIZE sub-calls.
+    Keys are (owner, token_address), token_address None meaning native ETH;
+    a value of None means that sub-call reverted.
+    """
+    if not settings.MULTICALL_ADDRESS:
+        raise MulticallNotConfiguredError("MULTICALL_ADDRESS is not set; deploy Multicall3 and configure it.")
+
+    _ensure_ganache_available()
+    multicall_address = Web3.to_checksum_address(settings.MULTICALL_ADDRESS)
+    if not web3_ganache.eth.get_code(multicall_address, block_identifier=block_number):
+        # Typical after a Ganache restart: the contract has to be deployed again
+        raise MulticallNotConfiguredError(f"No Multicall3 contract deployed at {multicall_address}.")
+    multicall = web3_ganache.eth.contract(address=multicall_address, abi=MULTICALL3_ABI)
+    tokens = {token: web3_ganache.eth.contract(address=Web3.to_checksum_address(token), abi=ERC20_ABI)
+              for token in token_addresses}
+
+    keys: list[tuple[str, str | None]] = []
+    calls: list[tuple[str, bool, bytes]] = []
+    for owner in owners:
+        owner_checksum = Web3.to_checksum_address(owner)
+        keys.append((owner, None))
+        eth_call_data = multicall.encode_abi("getEthBalance", args=[owner_checksum])
+        calls.append((multicall.address, True, Web3.to_bytes(hexstr=eth_call_data)))
+        for token, contract in tokens.items():
+            keys.append((owner, token))
+            token_call_data = contract.encode_abi("balanceOf", args=[owner_checksum])
+            calls.append((contract.address, True, Web3.to_bytes(hexstr=token_call_data)))
+
+    balances: dict[tuple[str, str | None], int | None] = {}
+    batch_size = settings.MULTICALL_BATCH_SIZE
+    for start in range(0, len(calls), batch_size):
+        try:
+            results = multicall.functions.aggregate3(calls[start:start + batch_size]).call(block_identifier=block_number)
+        except (ContractLogicError, BadFunctionCallOutput) as exc:
+            raise MulticallNotConfiguredError(f"Contract at {multicall_address} is not a working Multicall3.") from exc
+        for key, (success, return_data) in zip(keys[start:start + batch_size], results):
+            if success and len(return_data) >= 32:
+                balances[key] = web3_ganache.codec.decode(["uint256"], return_data)[0]
+            else:
+                balances[key] = None
+    return balances
+
+def _address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address.lower()[2:]
+
+def get_erc20_transfers_for_address(address: str, token_addresses: list[str], start_block: int | None = None, end_block: int | None = None) -> list[dict]:
+    """
+    Decode ERC-20 Transfer events of the given tokens sent or received by
+    address between start_block and end_block (inclusive). Values are raw
+    token units. Defaults to the full chain.
+    """
+    if not web3_ganache.is_address(address):
+        raise ValueError("Invalid Ethereum address")
+    if not token_addresses:
+        return []
+
+    _ensure_ganache_available()
+    contracts = [Web3.to_checksum_address(token) for token in token_addresses]
+    base_filter = {
+        "address": contracts,
+        "fromBlock": 0 if start_block is None else start_block,
+        "toBlock": get_block_number() if end_block is None else end_block,
+    }
+    topic = _address_topic(address)
+    # Topic positions are ANDed, so sender and recipient need one query each
+    logs = web3_ganache.eth.get_logs({**base_filter, "topics": [TRANSFER_EVENT_TOPIC, topic]})
+    logs += web3_ganache.eth.get_logs({**base_filter, "topics": [TRANSFER_EVENT_TOPIC, None, topic]})
+
+    transfer_event = web3_ganache.eth.contract(abi=ERC20_ABI).events.Transfer()
+    seen: set[tuple[str, int]] = set()
+    transfers: list[dict] = []
+    for log in logs:
+        tx_hash = log["transactionHash"].hex()
+        if (tx_hash, log["logIndex"]) in seen:  # Self-transfers match both queries
+            continue
+        seen.add((tx_hash, log["logIndex"]))
+
+        event = transfer_event.process_log(log)
+        transfers.append({
+            "hash": tx_hash,
+            "token_address": event["address"],
+            "from": event["args"]["from"],
+            "to": event["args"]["to"],
+            "value": event["args"]["value"],
+            "block_number": event["blockNumber"],
+            "log_index": event["logIndex"],
+        })
+
+    # Newest first by block number, then log position within the block
+    transfers.sort(key=lambda t: (t["block_number"], t["log_index"]), reverse=True)
+    return transfers
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so give the app a throwaway SQLite DB and
+# a Ganache URL before any backend module is imported.
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "20")
+os.environ.setdefault("CHAIN_ID", "1337")
+os.environ.setdefault("GANACHE_URL", "http://127.0.0.1:7545")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from database.db_config import Base, SessionLocal, engine
+from database.models import Account
+from service import balance_updater as balance_updater_module
+from service.balance_updater import BalanceWriteBehind
+
+
+@pytest.fixture
+def updater(monkeypatch):
+    # The load/refresh listeners read the module-level instance
+    fresh = BalanceWriteBehind(batch_size=3, flush_interval=0.05)
+    monkeypatch.setattr(balance_updater_module, "balance_updater", fresh)
+    return fresh
+
+
+@pytest.fixture
+def account_ids():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    accounts = [Account(user_id=1, balance=1.0, is_active=True) for _ in range(3)]
+    db.add_all(accounts)
+    db.commit()
+    ids = [account.account_id for account in accounts]
+    db.close()
+    yield ids
+    db = SessionLocal()
+    db.query(Account).filter(Account.account_id.in_(ids)).delete()
+    db.commit()
+    db.close()
+
+
+def _stored_balances(ids):
+    with engine.connect() as conn:
+        rows = conn.execute(Account.__table__.select().where(Account.__table__.c.account_id.in_(ids)))
+        return {row.account_id: row.balance for row in rows}
+
+
+def _queue(updater, account_id, balance):
+    db = SessionLocal()
+    account = db.get(Account, account_id)
+    updater.queue(account, balance)
+    db.close()
+
+
+def test_flush_writes_all_pending_balances_in_one_statement(updater, account_ids):
+    for account_id in account_ids[:2]:
+        _queue(updater, account_id, 5.0)
+    assert _stored_balances(account_ids) == dict.fromkeys(account_ids, 1.0)
+
+    statements = []
+    listener = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert updater.flush() == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 1
+    assert _stored_balances(account_ids) == {account_ids[0]: 5.0, account_ids[1]: 5.0, account_ids[2]: 1.0}
+    assert updater.flush() == 0
+
+
+def test_full_batch_does_not_flush_inline(updater, account_ids, monkeypatch):
+    monkeypatch.setattr(updater, "flush", lambda: pytest.fail("queue() must not flush inline"))
+    for account_id in account_ids:
+        _queue(updater, account_id, 2.0)
+    assert _stored_balances(account_ids) == dict.fromkeys(account_ids, 1.0)
+
+
+def test_full_batch_wakes_background_flush(updater, account_ids):
+    updater.flush_interval = 60  # Only the wake-up can trigger a flush in time
+
+    async def scenario():
+        task = asyncio.create_task(updater.run_periodic_flush())
+        await asyncio.sleep(0)
+        for account_id in account_ids:
+            await asyncio.to_thread(_queue, updater, account_id, 3.0)
+        for _ in range(100):
+            if _stored_balances(account_ids) == dict.fromkeys(account_ids, 3.0):
+                break
+            await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert _stored_balances(account_ids) == dict.fromkeys(account_ids, 3.0)
+
+
+def test_failed_flush_requeues_without_overwriting_newer_values(updater, account_ids, monkeypatch):
+    _queue(updater, account_ids[0], 4.0)
+    _queue(updater, account_ids[1], 4.0)
+
+    class FailingSession:
+        def execute(self, *args, **kwargs):
+            # A newer balance arrives while the failing batch is in flight
+            updater._pending[account_ids[0]] = 9.0
+            raise RuntimeError("database is locked")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(balance_updater_module, "SessionLocal", FailingSession)
+    with pytest.raises(RuntimeError):
+        updater.flush()
+    assert updater.pending_balance(account_ids[0]) == 9.0
+    assert updater.pending_balance(account_ids[1]) == 4.0
+
+    monkeypatch.setattr(balance_updater_module, "SessionLocal", SessionLocal)
+    assert updater.flush() == 2
+    assert _stored_balances(account_ids)[account_ids[0]] == 9.0
+
+
+def test_pending_balance_survives_commit_and_new_sessions(updater, account_ids):
+    db = SessionLocal()
+    account = db.get(Account, account_ids[0])
+    updater.queue(account, 7.0)
+    db.commit()  # Expires the account; the reload must not show the stored 1.0
+    assert account.balance == 7.0
+    db.close()
+
+    other = SessionLocal()
+    assert other.get(Account, account_ids[0]).balance == 7.0
+    other.close()
+    assert _stored_balances(account_ids)[account_ids[0]] == 1.0
+
+
+def test_discard_drops_pending_balance(updater, account_ids):
+    _queue(updater, account_ids[0], 8.0)
+    updater.discard(account_ids[0])
+    assert updater.pending_balance(account_ids[0]) is None
+    assert updater.flush() == 0
+
+
+class _BlockingSession:
+    """Session whose execute blocks until released, then fails or succeeds."""
+
+    def __init__(self, entered: threading.Event, release: threading.Event, fail: bool) -> None:
+        self._real = SessionLocal()
+        self._entered, self._release, self._fail = entered, release, fail
+
+    def execute(self, *args, **kwargs):
+        self._entered.set()
+        self._release.wait(timeout=5)
+        if self._fail:
+            raise RuntimeError("database is locked")
+        return self._real.execute(*args, **kwargs)
+
+    def commit(self):
+        self._real.commit()
+
+    def rollback(self):
+        self._real.rollback()
+
+    def close(self):
+        self._real.close()
+
+
+def test_concurrent_flushes_are_serialized(updater, account_ids, monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+    monkeypatch.setattr(balance_updater_module, "SessionLocal",
+                        lambda: _BlockingSession(entered, release, fail=False))
+    _queue(updater, account_ids[0], 6.0)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(updater.flush)
+        entered.wait(timeout=5)
+        _queue(updater, account_ids[1], 6.0)
+        second = pool.submit(updater.flush)
+        threading.Event().wait(0.1)
+        # The second flush waits instead of clobbering the in-flight batch
+        assert not second.done()
+        assert updater.pending_balance(account_ids[0]) == 6.0
+        release.set()
+        assert first.result() == 1
+        assert second.result() == 1
+
+    assert _stored_balances(account_ids) == {account_ids[0]: 6.0, account_ids[1]: 6.0, account_ids[2]: 1.0}
+
+
+def test_discard_during_failed_flush_is_not_requeued(updater, account_ids, monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+    monkeypatch.setattr(balance_updater_module, "SessionLocal",
+                        lambda: _BlockingSession(entered, release, fail=True))
+    _queue(updater, account_ids[0], 4.0)
+    _queue(updater, account_ids[1], 4.0)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        flush = pool.submit(updater.flush)
+        entered.wait(timeout=5)
+        updater.discard(account_ids[0])
+        assert updater.pending_balance(account_ids[0]) is None
+        release.set()
+        with pytest.raises(RuntimeError):
+            flush.result()
+
+    assert updater.pending_balance(account_ids[0]) is None
+    assert updater.pending_balance(account_ids[1]) == 4.0
@@ -0,0 +1,233 @@
+import pytest
+from eth_utils import function_signature_to_4byte_selector
+from hexbytes import HexBytes
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from web3 import Web3
+
+from database.models import RegisteredToken
+from service import portfolio_service, web3_service
+from service.portfolio_service import BlockBalanceCache
+from service.web3_service import GanacheUnavailableError, MulticallNotConfiguredError, TRANSFER_EVENT_TOPIC
+
+OWNER = "0x" + "aa" * 20
+TOKEN = RegisteredToken(address="0x" + "BB" * 20, symbol="TKN", name="Test Token", decimals=6)
+
+
+def test_cache_hits_only_for_the_same_block_hash():
+    cache = BlockBalanceCache()
+    cache.put_many(b"block-1", {(OWNER, None): 5})
+
+    assert cache.get_many(b"block-1", [(OWNER, None)]) == {(OWNER, None): 5}
+    assert cache.get_many(b"block-2", [(OWNER, None)]) == {}
+
+
+def test_cache_replaces_entries_when_the_block_changes_in_any_direction():
+    cache = BlockBalanceCache()
+    cache.put_many(b"new-chain-high", {(OWNER, None): 5})
+    # A restarted chain reports a lower block; it must still be cached
+    cache.put_many(b"restarted-chain-low", {(OWNER, None): 1})
+
+    assert cache.get_many(b"restarted-chain-low", [(OWNER, None)]) == {(OWNER, None): 1}
+    assert cache.get_many(b"new-chain-high", [(OWNER, None)]) == {}
+
+
+@pytest.fixture
+def fake_chain(monkeypatch):
+    chain = {"block": {"number": 7, "hash": b"hash-7"}, "multicalls": []}
+
+    def get_balances_via_multicall(owners, token_addresses, block_number):
+        chain["multicalls"].append((list(owners), list(token_addresses), block_number))
+        balances = {}
+        for owner in owners:
+            balances[(owner, None)] = 2 * 10**18
+            for token in token_addresses:
+                balances[(owner, token)] = 1_500_000
+        return balances
+
+    monkeypatch.setattr(portfolio_service, "balance_cache", BlockBalanceCache())
+    monkeypatch.setattr(portfolio_service, "get_latest_block", lambda: chain["block"])
+    monkeypatch.setattr(portfolio_service, "get_balances_via_multicall", get_balances_via_multicall)
+    return chain
+
+
+def test_portfolios_are_read_in_one_batch_and_cached_per_block(fake_chain):
+    other = "0x" + "cc" * 20
+    result = portfolio_service.get_portfolios([TOKEN], [OWNER, other])
+
+    assert result["block_number"] == 7
+    assert result["portfolios"][OWNER]["eth_balance"] == 2.0
+    assert result["portfolios"][other]["tokens"][0]["balance"] == 1.5
+    assert len(fake_chain["multicalls"]) == 1
+
+    portfolio_service.get_portfolios([TOKEN], [OWNER])
+    assert len(fake_chain["multicalls"]) == 1
+
+    # Same height, different hash: e.g. Ganache restarted and mined back up
+    fake_chain["block"] = {"number": 7, "hash": b"other-chain-7"}
+    portfolio_service.get_portfolios([TOKEN], [OWNER])
+    assert len(fake_chain["multicalls"]) == 2
+
+
+def test_multicall_without_deployed_contract_is_not_configured(monkeypatch):
+    monkeypatch.setattr(web3_service.settings, "MULTICALL_ADDRESS", "0x" + "dd" * 20)
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: True)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_code", lambda *args, **kwargs: b"", raising=False)
+
+    with pytest.raises(MulticallNotConfiguredError):
+        web3_service.get_balances_via_multicall([OWNER], [], 1)
+
+
+def test_portfolios_report_ganache_down_as_unavailable(monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise RequestsConnectionError("connection refused")
+
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: False)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_block", unreachable, raising=False)
+
+    with pytest.raises(GanacheUnavailableError):
+        portfolio_service.get_portfolios([], [OWNER])
+
+
+GET_ETH_BALANCE = function_signature_to_4byte_selector("getEthBalance(address)")
+BALANCE_OF = function_signature_to_4byte_selector("balanceOf(address)")
+AGGREGATE3 = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+MULTICALL = "0x" + "dd" * 20
+OWNERS = ["0x" + f"{i:02x}" * 20 for i in (1, 2, 3)]
+TOKENS = ["0x" + "b1" * 20, "0x" + "b2" * 20, "0x" + "b3" * 20]  # b2 reverts, b3 returns short data
+
+
+def _balance_for(owner: str, token: str | None) -> int:
+    token_index = 0 if token is None else TOKENS.index(token.lower()) + 1
+    return int(owner[-2:], 16) * 1000 + token_index
+
+
+@pytest.fixture
+def fake_multicall(monkeypatch):
+    codec = web3_service.web3_ganache.codec
+    batches = []
+
+    def call(transaction, block_identifier=None, **kwargs):
+        data = HexBytes(transaction["data"])
+        assert data[:4] == AGGREGATE3
+        assert transaction["to"].lower() == MULTICALL
+        (calls,) = codec.decode(["(address,bool,bytes)[]"], data[4:])
+        batches.append({"size": len(calls), "block": block_identifier})
+
+        results = []
+        for target, allow_failure, call_data in calls:
+            assert allow_failure is True
+            (owner,) = codec.decode(["address"], call_data[4:])
+            if call_data[:4] == GET_ETH_BALANCE:
+                assert target.lower() == MULTICALL
+                results.append((True, codec.encode(["uint256"], [_balance_for(owner, None)])))
+            elif target.lower() == TOKENS[1]:
+                results.append((False, b""))
+            elif target.lower() == TOKENS[2]:
+                results.append((True, b"\x01"))
+            else:
+                assert call_data[:4] == BALANCE_OF
+                results.append((True, codec.encode(["uint256"], [_balance_for(owner, target)])))
+        return HexBytes(codec.encode(["(bool,bytes)[]"], [results]))
+
+    monkeypatch.setattr(web3_service.settings, "MULTICALL_ADDRESS", MULTICALL)
+    monkeypatch.setattr(web3_service.settings, "MULTICALL_BATCH_SIZE", 5)
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: True)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_code", lambda *args, **kwargs: b"\x60", raising=False)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "call", call, raising=False)
+    return batches
+
+
+def test_multicall_decodes_every_sub_call_across_chunks(fake_multicall):
+    balances = web3_service.get_balances_via_multicall(OWNERS, TOKENS, 12)
+
+    # 3 owners x (ETH + 3 tokens) = 12 sub-calls in chunks of 5
+    assert [batch["size"] for batch in fake_multicall] == [5, 5, 2]
+    assert {batch["block"] for batch in fake_multicall} == {12}
+    assert len(balances) == 12
+    for owner in OWNERS:
+        assert balances[(owner, None)] == _balance_for(owner, None)
+        assert balances[(owner, TOKENS[0])] == _balance_for(owner, TOKENS[0])
+        assert balances[(owner, TOKENS[1])] is None  # Reverted
+        assert balances[(owner, TOKENS[2])] is None  # Shorter than one uint256
+
+
+def test_multicall_without_deployed_contract_is_not_configured(monkeypatch):
+    monkeypatch.setattr(web3_service.settings, "MULTICALL_ADDRESS", MULTICALL)
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: True)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_code", lambda *args, **kwargs: b"", raising=False)
+
+    with pytest.raises(MulticallNotConfiguredError):
+        web3_service.get_balances_via_multicall([OWNER], [], 1)
+
+
+ALICE = Web3.to_checksum_address("0x" + "a1" * 20)
+BOB = Web3.to_checksum_address("0x" + "b0" * 20)
+USDC = RegisteredToken(address=Web3.to_checksum_address("0x" + "c1" * 20), symbol="USDC", name="USD Coin", decimals=6)
+DAI = RegisteredToken(address=Web3.to_checksum_address("0x" + "c2" * 20), symbol="DAI", name="Dai", decimals=18)
+
+
+def _topic(address: str) -> HexBytes:
+    return HexBytes("0x" + "0" * 24 + address.lower()[2:])
+
+
+def _transfer_log(token, sender, recipient, value, block_number, log_index, tx_byte):
+    return {
+        "address": token.address,
+        "topics": [HexBytes(TRANSFER_EVENT_TOPIC), _topic(sender), _topic(recipient)],
+        "data": HexBytes(web3_service.web3_ganache.codec.encode(["uint256"], [value])),
+        "blockNumber": block_number,
+        "transactionHash": HexBytes(bytes([tx_byte]) * 32),
+        "transactionIndex": 0,
+        "blockHash": HexBytes(bytes([block_number]) * 32),
+        "logIndex": log_index,
+        "removed": False,
+    }
+
+
+@pytest.fixture
+def fake_logs(monkeypatch):
+    chain_logs = [
+        _transfer_log(USDC, ALICE, BOB, 2_500_000, 3, 0, 1),                # Alice sends
+        _transfer_log(DAI, BOB, ALICE, 3 * 10**18, 5, 1, 2),                # Alice receives
+        _transfer_log(DAI, ALICE, ALICE, 10**18, 5, 0, 3),                  # Self-transfer
+        _transfer_log(USDC, BOB, BOB, 1_000_000, 4, 0, 4),                  # Not Alice's
+    ]
+    filters = []
+
+    def get_logs(filter_params):
+        filters.append(filter_params)
+        topics = filter_params["topics"]
+        matched = []
+        for log in chain_logs:
+            if log["topics"][0] != HexBytes(topics[0]):
+                continue
+            if any(wanted is not None and log["topics"][position] != HexBytes(wanted)
+                   for position, wanted in enumerate(topics[1:], start=1)):
+                continue
+            matched.append(log)
+        return matched
+
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: True)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_logs", get_logs, raising=False)
+    monkeypatch.setattr(web3_service, "get_block_number", lambda: 9)
+    return filters
+
+
+def test_token_transfers_are_filtered_deduplicated_scaled_and_sorted(fake_logs):
+    transfers = portfolio_service.get_token_transfers([USDC, DAI], ALICE)
+
+    alice_topic = "0x" + "0" * 24 + ALICE.lower()[2:]
+    assert [f["topics"] for f in fake_logs] == [
+        [TRANSFER_EVENT_TOPIC, alice_topic],
+        [TRANSFER_EVENT_TOPIC, None, alice_topic],
+    ]
+    assert all(f["address"] == [USDC.address, DAI.address] for f in fake_logs)
+    assert all((f["fromBlock"], f["toBlock"]) == (0, 9) for f in fake_logs)
+
+    assert [(t["block_number"], t["log_index"]) for t in transfers] == [(5, 1), (5, 0), (3, 0)]
+    assert [(t["symbol"], t["from"], t["to"], t["value"]) for t in transfers] == [
+        ("DAI", BOB, ALICE, 3.0),
+        ("DAI", ALICE, ALICE, 1.0),
+        ("USDC", ALICE, BOB, 2.5),
+    ]
+    assert transfers[0]["hash"] == (bytes([2]) * 32).hex()
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event
+
+from database.db_config import Base, SessionLocal, engine
+from database.models import RegisteredToken
+from service import token_service
+
+METADATA = {"address": "0x" + "EE" * 20, "symbol": "DUP", "name": "Duplicate", "decimals": 18}
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(token_service, "get_erc20_metadata", lambda address: dict(METADATA))
+    first, second = SessionLocal(), SessionLocal()
+    yield first, second
+    first.close()
+    second.close()
+    cleanup = SessionLocal()
+    cleanup.query(RegisteredToken).filter(RegisteredToken.address == METADATA["address"]).delete()
+    cleanup.commit()
+    cleanup.close()
+
+
+def test_register_token_stores_chain_metadata(sessions):
+    first, _ = sessions
+    token = token_service.register_token(first, METADATA["address"])
+
+    assert (token.symbol, token.decimals) == ("DUP", 18)
+    assert [t.address for t in token_service.list_tokens(first)] == [METADATA["address"]]
+
+
+def test_registration_losing_the_insert_race_is_a_value_error(sessions):
+    first, second = sessions
+
+    # The second request registers the token after the first one's duplicate
+    # check passed but before its commit
+    @event.listens_for(first, "before_commit", once=True)
+    def register_concurrently(session):
+        token_service.register_token(second, METADATA["address"])
+
+    with pytest.raises(ValueError, match="Token already registered"):
+        token_service.register_token(first, METADATA["address"])
+
+    assert len(token_service.list_tokens(first)) == 1
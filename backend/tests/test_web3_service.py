@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service import web3_service
+from service.web3_service import SingleFlight
+
+N_CALLERS = 8
+
+
+def _requested(flight: SingleFlight, kind: str) -> int:
+    return flight.stats()["kinds"].get(kind, {}).get("requested", 0)
+
+
+def _slow_rpc(result, started: threading.Event, release: threading.Event, calls: list):
+    def rpc():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return rpc
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    flight = SingleFlight()
+    started, release, calls = threading.Event(), threading.Event(), []
+    rpc = _slow_rpc(42, started, release, calls)
+
+    def caller():
+        return flight.do(("get_balance", "0xabc"), rpc)
+
+    with ThreadPoolExecutor(max_workers=N_CALLERS) as pool:
+        futures = [pool.submit(caller) for _ in range(N_CALLERS)]
+        # Let every caller reach the in-flight call before the RPC returns
+        while _requested(flight, "get_balance") < N_CALLERS:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [42] * N_CALLERS
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert stats["in_flight"] == 0
+    assert stats["kinds"]["get_balance"] == {
+        "requested": N_CALLERS,
+        "executed": 1,
+        "shared": N_CALLERS - 1,
+        "fan_in_ratio": N_CALLERS,
+    }
+
+
+def test_single_flight_gives_each_caller_its_own_error():
+    flight = SingleFlight()
+    started, release, calls = threading.Event(), threading.Event(), []
+    original = ValueError("node down")
+    rpc = _slow_rpc(original, started, release, calls)
+
+    def caller():
+        try:
+            flight.do(("block_number",), rpc)
+        except ValueError as exc:
+            return exc
+
+    with ThreadPoolExecutor(max_workers=N_CALLERS) as pool:
+        futures = [pool.submit(caller) for _ in range(N_CALLERS)]
+        while _requested(flight, "block_number") < N_CALLERS:
+            threading.Event().wait(0.01)
+        release.set()
+        errors = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert [str(error) for error in errors] == ["node down"] * N_CALLERS
+    waiter_errors = [error for error in errors if error is not original]
+    assert len(waiter_errors) == N_CALLERS - 1
+    assert len({id(error) for error in waiter_errors}) == N_CALLERS - 1
+    assert all(error.__cause__ is original for error in waiter_errors)
+
+
+def test_single_flight_keeps_metrics_per_call_kind():
+    flight = SingleFlight()
+    for block_number in range(3):
+        flight.do(("get_block", block_number, True), lambda: None)
+    flight.do(("block_number",), lambda: 1)
+
+    kinds = flight.stats()["kinds"]
+    assert kinds["get_block"]["executed"] == 3
+    assert kinds["block_number"]["executed"] == 1
+    assert "is_connected" not in kinds
+
+
+def test_single_flight_does_not_cache_after_completion():
+    flight = SingleFlight()
+    values = iter([1, 2])
+
+    assert flight.do(("block_number",), lambda: next(values)) == 1
+    assert flight.do(("block_number",), lambda: next(values)) == 2
+    assert flight.stats()["kinds"]["block_number"]["executed"] == 2
+
+
+@pytest.fixture
+def fake_node(monkeypatch):
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def get_balance(address):
+        calls.append(address)
+        release.wait(timeout=5)
+        return 10**18
+
+    monkeypatch.setattr(web3_service, "rpc_single_flight", flight)
+    monkeypatch.setattr(web3_service.web3_ganache, "is_connected", lambda: True)
+    monkeypatch.setattr(web3_service.web3_ganache.eth, "get_balance", get_balance, raising=False)
+    return flight, calls, release
+
+
+def test_balance_reads_are_coalesced(fake_node):
+    flight, calls, release = fake_node
+    address = "0x" + "ab" * 20
+
+    with ThreadPoolExecutor(max_workers=N_CALLERS) as pool:
+        futures = [pool.submit(web3_service.get_account_balance_from_blockchain, address)
+                   for _ in range(N_CALLERS)]
+        while _requested(flight, "get_balance") < N_CALLERS:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert all(result == 1 for result in results)
+    assert len(calls) == 1
+
+
+def test_uncoalesced_balance_read_always_hits_node(fake_node):
+    flight, calls, release = fake_node
+    release.set()
+    address = "0x" + "ab" * 20
+
+    for _ in range(3):
+        web3_service.get_account_balance_from_blockchain(address, coalesce=False)
+
+    assert len(calls) == 3
+    assert flight.stats()["kinds"] == {}